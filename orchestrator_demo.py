@@ -8,203 +8,833 @@
 #   User Request → Orchestrator → Vision Agent → JSON Response → Report
 # ============================================================
 
-import json
+import asyncio
+import functools
+import os
+import sys
+import textwrap
+import threading
 import time
-from datetime import datetime
+import uuid
+from collections import ChainMap, deque
+from dataclasses import asdict, dataclass, field, fields, is_dataclass
+from types import MappingProxyType
+
+# json/sqlite3 (SqliteStateStore), datetime (_now_iso), and
+# prompt_toolkit (interactive CLI) are imported lazily at their call
+# sites to keep the demo's cold-start import time lean.
+
+# Timestamps only need second precision for report stamping, so the
+# isoformat string is rebuilt at most once per second instead of on every
+# request (one clock_gettime + full string build per call otherwise).
+_ts_lock = threading.Lock()
+_last_ts_second = -1
+_last_ts_str = ""
 
-# --- 1. MOCK VISION AGENT NODE (The "Plug" for your Notebook) ---
-# In production, you would import this: 
-# from Vision_Agent_2_5D_Attention import run_vision_agent
 
-def call_vision_node(image_path):
+def _now_iso():
     """
-    Simulates calling the Vision Agent Node.
-    In production, this would execute the actual model inference.
+    Second-resolution ISO timestamp, cached across calls within the
+    same wall-clock second.
     """
-    print(f"\n[System] 📡 Connecting to Vision Agent Node...")
-    print(f"[System] 📤 Sending payload: {image_path}")
-    
-    # Simulate processing time (the 'thinking' phase)
-    time.sleep(2) 
-    
-    # This is the exact JSON format your Notebook outputs
-    vision_response = {
-        "agent_id": "vision_expert_01",
-        "agent_type": "2.5D_Attention_UNet",
-        "timestamp": datetime.now().isoformat(),
-        "diagnosis": "Glioma",
-        "confidence_score": 0.94,
-        "stability_check": "PASSED",
-        "stability_score": 0.9812,
-        "tumor_size_cm": 2.45,
-        "tumor_location": "Temporal Lobe (Approximated)",
-        "explanation_path": "./outputs/gradcam_heatmap.png",
-        "model_version": "v1.0.0"
-    }
-    
-    print(f"[System] 📥 Received structured data from Vision Node.")
-    return vision_response
+    global _last_ts_second, _last_ts_str
+    from datetime import datetime  # deferred: only paid on first call
+
+    second = int(time.time())
+    with _ts_lock:
+        if second != _last_ts_second:
+            _last_ts_second = second
+            _last_ts_str = datetime.fromtimestamp(second).isoformat(timespec="seconds")
+        return _last_ts_str
+
+# Scale factor for all simulated agent latencies. CI/stress runs set
+# ORCH_DEMO_DELAY=0 to make the demo instant and deterministic.
+_SIM_DELAY = float(os.getenv("ORCH_DEMO_DELAY", "1.0"))
 
 
-# --- 2. MOCK VALIDATION AGENT (Neo4j Knowledge Graph) ---
-def call_validation_agent(diagnosis):
+async def _simulate_latency(seconds):
     """
-    Simulates the Validation Agent that cross-references
-    diagnosis with medical knowledge graphs.
+    Stand-in for a real agent round-trip, scaled by ORCH_DEMO_DELAY.
     """
-    print(f"\n[System] 🔍 Querying Validation Agent (Neo4j)...")
-    time.sleep(1)
-    
-    # Simulated knowledge graph lookup
-    knowledge_base = {
-        "Glioma": {
-            "severity": "High",
-            "common_treatments": ["Surgery", "Radiation Therapy", "Chemotherapy"],
-            "survival_rate": "Variable (depends on grade)",
-            "icd_code": "C71.9"
-        },
-        "Meningioma": {
-            "severity": "Low to Moderate",
-            "common_treatments": ["Observation", "Surgery", "Radiation"],
-            "survival_rate": "Generally favorable",
-            "icd_code": "D32.9"
-        },
-        "No Tumor": {
-            "severity": "None",
-            "common_treatments": ["None required"],
-            "survival_rate": "N/A",
-            "icd_code": "N/A"
-        }
-    }
-    
-    return knowledge_base.get(diagnosis, {"severity": "Unknown"})
+    await asyncio.sleep(seconds * _SIM_DELAY)
 
 
-# --- 3. THE ORCHESTRATOR (The "Brain") ---
-class MedicalOrchestrator:
+# --- 1. OBSERVABILITY (FlowEvent hooks) ---
+@dataclass(frozen=True)
+class FlowEvent:
     """
-    Central orchestrator that manages the multi-agent workflow.
-    In production, this would be powered by an LLM (GPT-4, Claude, etc.)
+    One orchestration transition (agent started, cache hit, retry, ...).
+    `data` carries the raw payload; sinks decide how (and whether) to
+    render it, so silent deployments never pay for message formatting.
     """
-    
-    def __init__(self):
-        self.system_prompt = """You are a helpful medical assistant. 
-        Use specialized tools for precise diagnosis. 
-        Always validate findings with knowledge graphs."""
-        self.conversation_history = []
-    
-    def process_request(self, user_query, image_path=None):
-        """
-        Main entry point for processing user requests.
-        Implements routing logic to determine which agents to invoke.
-        """
+    kind: str
+    agent: str = ""
+    data: object = None
+
+
+def null_flow_sink(event):
+    """
+    Default sink: production-mode silence.
+    """
+
+
+def stdout_flow_sink(event):
+    """
+    Demo sink: renders FlowEvents in the CLI's [System]/[Orchestrator]
+    narration style. All message formatting lives here, so it is only
+    paid when this sink is attached.
+    """
+    kind = event.kind
+    if kind == "user_request":
         print("=" * 60)
-        print(f"🔹 USER: {user_query}")
+        print(f"🔹 USER: {event.data}")
         print("=" * 60)
-        
-        # LOGIC 1: ROUTING (Deciding what to do)
-        if image_path:
-            print("\n[Orchestrator] 🧠 Intent detected: Medical Image Analysis")
-            print("[Orchestrator] 🛠️  Routing to: VISION_AGENT_NODE")
-            
-            # Step 1: Call Vision Agent
-            vision_data = call_vision_node(image_path)
-            
-            # Step 2: Validate with Knowledge Graph
-            print("\n[Orchestrator] 🛠️  Routing to: VALIDATION_AGENT")
-            validation_data = call_validation_agent(vision_data["diagnosis"])
-            
-            # Step 3: Synthesize final response
-            return self.synthesize_response(vision_data, validation_data)
-        else:
-            return "[Orchestrator] ⚠️ Please provide an MRI image for analysis."
+    elif kind == "intent":
+        print(f"\n[Orchestrator] 🧠 Intent detected: {event.data}")
+    elif kind == "route":
+        print(f"[Orchestrator] 🛠️  Routing to: {event.data}")
+    elif kind == "resume":
+        print(f"[Orchestrator] ♻️  Resuming '{event.data['step']}' from checkpoint "
+              f"(trace {event.data['trace_id']})")
+    elif kind == "synthesize":
+        print("\n[Orchestrator] 📝 Synthesizing Final Report...")
+    elif kind == "vision_connect":
+        print(f"\n[System] 📡 Connecting to Vision Agent Node...")
+    elif kind == "vision_send":
+        print(f"[System] 📤 Sending batched payload: {event.data} scan(s)")
+    elif kind == "vision_receive":
+        print(f"[System] 📥 Received structured data from Vision Node.")
+    elif kind == "validation_query":
+        print(f"\n[System] 🔍 Querying Validation Agent (Neo4j + ICD + guidelines)...")
+    elif kind == "validation_cache_hit":
+        print(f"[System] ⚡ Cache hit for '{event.data}' — skipping round-trips.")
+    elif kind == "validation_degraded":
+        print(f"[System] ⚠️ Validation source failed, degrading: {event.data}")
+    elif kind == "retry":
+        print(f"[System] 🔁 Retrying '{event.agent}' "
+              f"(attempt {event.data['attempt']}/{event.data['max_retries']})...")
+
 
-    def synthesize_response(self, vision_data, validation_data):
+# --- 2. MOCK VISION AGENT NODE (The "Plug" for your Notebook) ---
+# In production, you would import this:
+# from Vision_Agent_2_5D_Attention import run_vision_agent
+
+@dataclass(frozen=True, slots=True)
+class VisionResponse:
+    """
+    Structured vision-agent result — the same fields as the Notebook's
+    JSON payload, but as a frozen slots dataclass: no per-instance
+    __dict__, attribute access instead of dict lookups downstream, and
+    safe to cache/share. Serialize with dataclasses.asdict only at the
+    JSON boundary.
+    """
+    agent_id: str
+    agent_type: str
+    timestamp: str
+    diagnosis: str
+    confidence_score: float
+    stability_check: str
+    stability_score: float
+    tumor_size_cm: float
+    tumor_location: str
+    explanation_path: str
+    model_version: str
+    # Derived once at construction so re-renders (retries, streaming,
+    # batches) never repeat the work. slots + frozen rule out
+    # functools.cached_property, so __post_init__ materializes them.
+    diagnosis_upper: str = field(init=False)
+    confidence_pct: float = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "diagnosis_upper", self.diagnosis.upper())
+        object.__setattr__(self, "confidence_pct", self.confidence_score * 100)
+
+
+async def run_vision_agent_batch(image_paths, on_event=null_flow_sink):
+    """
+    Simulates one batched inference pass over the Vision Agent Node.
+    Model startup/inference overhead is paid once per batch instead of
+    once per scan, which is where the throughput win comes from.
+    """
+    on_event(FlowEvent(kind="vision_connect", agent="vision"))
+    on_event(FlowEvent(kind="vision_send", agent="vision", data=len(image_paths)))
+
+    # Simulate processing time (the 'thinking' phase) — amortized over the batch
+    await _simulate_latency(2)
+
+    responses = []
+    for image_path in image_paths:
+        # Field-for-field the JSON payload your Notebook outputs
+        responses.append(VisionResponse(
+            agent_id="vision_expert_01",
+            agent_type="2.5D_Attention_UNet",
+            timestamp=_now_iso(),
+            diagnosis="Glioma",
+            confidence_score=0.94,
+            stability_check="PASSED",
+            stability_score=0.9812,
+            tumor_size_cm=2.45,
+            tumor_location="Temporal Lobe (Approximated)",
+            explanation_path="./outputs/gradcam_heatmap.png",
+            model_version="v1.0.0",
+        ))
+
+    on_event(FlowEvent(kind="vision_receive", agent="vision"))
+    return responses
+
+
+async def call_vision_node(image_path):
+    """
+    Single-scan convenience wrapper around the batched entry point.
+    """
+    return (await run_vision_agent_batch([image_path]))[0]
+
+
+def _revive_vision_response(payload):
+    """
+    Rebuilds a VisionResponse from a JSON-replayed checkpoint; derived
+    (init=False) fields are recomputed by __post_init__.
+    """
+    return VisionResponse(**{
+        f.name: payload[f.name] for f in fields(VisionResponse) if f.init})
+
+
+# --- 3. MOCK TRIAGE ROUTER (Cheap pre-classifier) ---
+class TriageRouter:
+    """
+    Simulates a lightweight classifier (think logistic regression over
+    cheap image features) that answers the easy cases up front, so the
+    heavyweight 2.5D Attention U-Net only sees scans that need it.
+    """
+
+    ROUTE_NO_TUMOR = "no_tumor_likely"
+    ROUTE_ESCALATE = "escalate"
+
+    def predict(self, image_path):
         """
-        Combines outputs from multiple agents into a coherent report.
-        This simulates how an LLM would generate natural language from structured data.
+        Returns (route, confidence) for the given scan.
         """
-        print("\n[Orchestrator] 📝 Synthesizing Final Report...")
-        time.sleep(1)
-        
-        # Build the clinical report
-        confidence_pct = vision_data['confidence_score'] * 100
-        stability_status = "✅ Stable" if vision_data['stability_check'] == "PASSED" else "⚠️ Unstable"
-        
-        report = f"""
+        # Deterministic stand-in for real features: routine screening scans
+        # are trivially classifiable; everything else escalates.
+        if "routine" in image_path or "healthy" in image_path:
+            return self.ROUTE_NO_TUMOR, 0.97
+        return self.ROUTE_ESCALATE, 0.55
+
+
+# --- 4. MOCK VALIDATION AGENT (Neo4j Knowledge Graph) ---
+# Simulated knowledge graph, built once at import time. Keys are interned
+# so the per-call lookup collapses to a pointer comparison, and the
+# MappingProxyType wrappers (plus tuple treatment lists) keep callers from
+# mutating shared or cached state.
+_KNOWLEDGE_BASE = MappingProxyType({sys.intern(diagnosis): MappingProxyType(entry) for diagnosis, entry in {
+    "Glioma": {
+        "severity": "High",
+        "common_treatments": ("Surgery", "Radiation Therapy", "Chemotherapy"),
+        "survival_rate": "Variable (depends on grade)",
+        "icd_code": "C71.9"
+    },
+    "Meningioma": {
+        "severity": "Low to Moderate",
+        "common_treatments": ("Observation", "Surgery", "Radiation"),
+        "survival_rate": "Generally favorable",
+        "icd_code": "D32.9"
+    },
+    "No Tumor": {
+        "severity": "None",
+        "common_treatments": ("None required",),
+        "survival_rate": "N/A",
+        "icd_code": "N/A"
+    }
+}.items()})
+
+# Sentinel returned for diagnoses the knowledge graph has never seen
+_UNKNOWN_DIAGNOSIS = MappingProxyType({"severity": "Unknown"})
+
+
+@functools.lru_cache(maxsize=256)
+def _lookup_knowledge_graph(diagnosis):
+    """
+    Cached, pure knowledge-graph lookup. The entries are immutable, so
+    repeat diagnoses resolve in O(1) without touching the (simulated)
+    Neo4j backend again.
+    """
+    return _KNOWLEDGE_BASE.get(diagnosis, _UNKNOWN_DIAGNOSIS)
+
+
+async def fetch_severity(diagnosis):
+    """
+    Simulates the Neo4j severity/prognosis lookup.
+    """
+    await _simulate_latency(1.0)
+    entry = _lookup_knowledge_graph(diagnosis)
+    return {
+        "severity": entry.get("severity", "Unknown"),
+        "survival_rate": entry.get("survival_rate", "N/A"),
+    }
+
+
+async def fetch_icd(diagnosis):
+    """
+    Simulates the ICD-10 coding service round-trip.
+    """
+    await _simulate_latency(0.6)
+    return {"icd_code": _lookup_knowledge_graph(diagnosis).get("icd_code", "N/A")}
+
+
+async def fetch_treatments(diagnosis):
+    """
+    Simulates the treatment-guideline knowledge-graph round-trip.
+    """
+    await _simulate_latency(0.8)
+    return {"common_treatments": _lookup_knowledge_graph(diagnosis).get("common_treatments", ("N/A",))}
+
+
+_VALIDATION_SOURCES = (fetch_severity, fetch_icd, fetch_treatments)
+
+
+async def call_validation_agent(diagnosis, on_event=null_flow_sink):
+    """
+    Validation Agent entry point: fans out to all validation sources in
+    parallel and merges their payloads, so total validation time is
+    max(sources) rather than sum(sources). A failed source is simply
+    dropped from the merge — the report falls back to its defaults.
+    Repeat diagnoses are served from the cache without any round-trip.
+    (With an async KG client this would be async_lru.alru_cache instead.)
+    """
+    diagnosis = sys.intern(diagnosis)
+    on_event(FlowEvent(kind="validation_query", agent="validation"))
+
+    cached = _validation_cache.get(diagnosis)
+    if cached is not None:
+        on_event(FlowEvent(kind="validation_cache_hit", agent="validation", data=diagnosis))
+        return cached
+
+    results = await asyncio.gather(
+        *(fetch(diagnosis) for fetch in _VALIDATION_SOURCES),
+        return_exceptions=True,
+    )
+    merged = {}
+    for result in results:
+        if isinstance(result, BaseException):
+            on_event(FlowEvent(kind="validation_degraded", agent="validation", data=result))
+            continue
+        merged.update(result)
+    merged.setdefault("severity", "Unknown")
+
+    validated = MappingProxyType(merged)
+    _validation_cache[diagnosis] = validated
+    return validated
+
+
+# Merged validation results for diagnoses already validated this process
+_validation_cache = {}
+
+
+# Clinical report section templates, compiled once at import time and
+# rendered via str.format_map over a ChainMap of agent payloads plus
+# defaults. Sections are separate so the synthesizer can stream each one
+# as soon as it is ready instead of building the full report first.
+_REPORT_SECTIONS = (
+    """
 ╔══════════════════════════════════════════════════════════════╗
 ║          🏥 AUTOMATED PRELIMINARY DIAGNOSTIC REPORT          ║
 ╠══════════════════════════════════════════════════════════════╣
-║  Date: {vision_data['timestamp'][:19]}                          
-║  Agent: {vision_data['agent_id']} ({vision_data['model_version']})              
-╠══════════════════════════════════════════════════════════════╣
+║  Date: {timestamp_short}
+║  Agent: {agent_id} ({model_version})
+""",
+    """╠══════════════════════════════════════════════════════════════╣
 ║                      PRIMARY FINDING                         ║
 ╠══════════════════════════════════════════════════════════════╣
-║  Diagnosis: {vision_data['diagnosis'].upper()}
-║  Location:  {vision_data['tumor_location']}
-║  Size:      {vision_data['tumor_size_cm']} cm
-╠══════════════════════════════════════════════════════════════╣
+║  Diagnosis: {diagnosis_upper}
+║  Location:  {tumor_location}
+║  Size:      {tumor_size_cm} cm
+""",
+    """╠══════════════════════════════════════════════════════════════╣
 ║                      AI CONFIDENCE                           ║
 ╠══════════════════════════════════════════════════════════════╣
 ║  Confidence Score:  {confidence_pct:.1f}%
 ║  Stability Check:   {stability_status}
-║  Stability Score:   {vision_data['stability_score']}
-╠══════════════════════════════════════════════════════════════╣
+║  Stability Score:   {stability_score}
+""",
+    """╠══════════════════════════════════════════════════════════════╣
 ║                 KNOWLEDGE GRAPH VALIDATION                   ║
 ╠══════════════════════════════════════════════════════════════╣
-║  Severity Level:    {validation_data['severity']}
-║  ICD-10 Code:       {validation_data.get('icd_code', 'N/A')}
-║  Common Treatments: {', '.join(validation_data.get('common_treatments', ['N/A']))}
-╠══════════════════════════════════════════════════════════════╣
+║  Severity Level:    {severity}
+║  ICD-10 Code:       {icd_code}
+║  Common Treatments: {treatments_str}
+""",
+    """╠══════════════════════════════════════════════════════════════╣
 ║                      NEXT STEPS                              ║
 ╠══════════════════════════════════════════════════════════════╣
-║  1. Review XAI Saliency Map: {vision_data['explanation_path']}
+║  1. Review XAI Saliency Map: {explanation_path}
 ║  2. Consult with specialist for confirmation
 ║  3. Schedule follow-up imaging if required
 ╚══════════════════════════════════════════════════════════════╝
 
 ⚠️ DISCLAIMER: This is an AI-assisted preliminary analysis.
    Final diagnosis must be confirmed by a qualified physician.
-"""
-        return report
+""",
+)
 
+# Fallbacks for fields a validation source may not return
+_REPORT_DEFAULTS = MappingProxyType({"icd_code": "N/A", "treatments_str": "N/A"})
 
-# --- 4. INTERACTIVE CLI DEMO ---
-def run_interactive_demo():
+
+# --- 5. RELIABILITY POLICY (timeouts + retries) ---
+@dataclass(frozen=True)
+class NodePolicy:
     """
-    Interactive demonstration mode for presenting to stakeholders.
+    Per-agent reliability budget: how long one attempt may run, how many
+    attempts are allowed, and the base for exponential backoff between
+    them. Bounds worst-case latency at roughly timeout_s * max_retries.
+    """
+    timeout_s: float = 10.0
+    max_retries: int = 3
+    backoff_s: float = 0.5
+
+
+@dataclass
+class FlowError(Exception):
+    """
+    Raised when an agent exhausts its NodePolicy retry budget.
+    Carries enough metadata for the caller to trace the failing node.
+    """
+    agent: str
+    attempts: int
+    last_error: str
+
+    def __str__(self):
+        return f"Agent '{self.agent}' failed after {self.attempts} attempt(s): {self.last_error}"
+
+
+async def invoke_with_policy(agent_name, make_call, policy, on_event=null_flow_sink):
+    """
+    Runs `make_call()` (a coroutine factory) under the policy's timeout,
+    retrying with exponential backoff. A hung agent can no longer stall
+    the event loop indefinitely.
+    """
+    last_error = None
+    for attempt in range(policy.max_retries):
+        if attempt:
+            await asyncio.sleep(policy.backoff_s * 2 ** (attempt - 1))
+            on_event(FlowEvent(kind="retry", agent=agent_name,
+                               data={"attempt": attempt + 1, "max_retries": policy.max_retries}))
+        try:
+            return await asyncio.wait_for(make_call(), policy.timeout_s)
+        except asyncio.TimeoutError:
+            last_error = f"timed out after {policy.timeout_s}s"
+        except Exception as exc:
+            last_error = repr(exc)
+    raise FlowError(agent=agent_name, attempts=policy.max_retries, last_error=last_error)
+
+
+# --- 6. STATE STORE (workflow checkpointing) ---
+class StateStore:
+    """
+    Journal of completed workflow steps, keyed by trace id. Lets a
+    crashed orchestration resume from its last checkpoint instead of
+    re-running expensive agent calls. Subclasses implement save/load.
+    """
+
+    def save(self, trace_id, step, outcome):
+        raise NotImplementedError
+
+    def load(self, trace_id):
+        """
+        Returns a {step: outcome} mapping of completed steps.
+        """
+        raise NotImplementedError
+
+
+class InMemoryStateStore(StateStore):
+    """
+    Default store: survives within the process only. Useful for the demo
+    and for tests; production deployments plug in a durable store.
+    """
+
+    def __init__(self):
+        self._journal = {}
+
+    def save(self, trace_id, step, outcome):
+        self._journal.setdefault(trace_id, {})[step] = outcome
+
+    def load(self, trace_id):
+        return dict(self._journal.get(trace_id, {}))
+
+
+class SqliteStateStore(StateStore):
+    """
+    Durable store backed by a local SQLite file; outcomes are stored as
+    JSON so a restarted process can replay completed steps.
+    """
+
+    def __init__(self, db_path="orchestrator_state.db"):
+        import sqlite3  # deferred: only this optional store needs it
+
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS step_journal ("
+            "  trace_id TEXT NOT NULL,"
+            "  step TEXT NOT NULL,"
+            "  outcome TEXT NOT NULL,"
+            "  PRIMARY KEY (trace_id, step))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _jsonify(obj):
+        # Vision payloads are dataclasses and validation payloads are
+        # MappingProxyType views; unwrap both for JSON
+        if is_dataclass(obj):
+            return asdict(obj)
+        if isinstance(obj, MappingProxyType):
+            return dict(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def save(self, trace_id, step, outcome):
+        import json
+
+        self._conn.execute(
+            "INSERT OR REPLACE INTO step_journal (trace_id, step, outcome) VALUES (?, ?, ?)",
+            (trace_id, step, json.dumps(outcome, default=self._jsonify)),
+        )
+        self._conn.commit()
+
+    def load(self, trace_id):
+        import json
+
+        rows = self._conn.execute(
+            "SELECT step, outcome FROM step_journal WHERE trace_id = ?", (trace_id,))
+        return {step: json.loads(outcome) for step, outcome in rows}
+
+
+# --- 7. WORKFLOW GRAMMAR (declarative pipelines) ---
+@dataclass(frozen=True)
+class AgentStepSpec:
+    """
+    One declarative workflow step. `fn` is a coroutine factory that
+    receives the outcomes of `deps` (in order) and produces this step's
+    outcome. `revive` optionally rebuilds a typed outcome from a
+    JSON-replayed checkpoint.
+    """
+    name: str
+    fn: object
+    deps: tuple = ()
+    revive: object = None
+
+
+async def execute_pipeline(steps, executor):
+    """
+    Runs step specs respecting their dependencies: every step whose deps
+    are satisfied executes concurrently with its peers via asyncio.gather.
+    `executor(step, *dep_outcomes)` owns the cross-cutting concerns
+    (checkpointing, retry policy, concurrency limits), so new pipelines
+    compose those behaviors without rewriting the glue. Returns a
+    {step name: outcome} mapping.
+    """
+    results = {}
+    pending = list(steps)
+    while pending:
+        ready = [s for s in pending if all(dep in results for dep in s.deps)]
+        if not ready:
+            unmet = [s.name for s in pending]
+            raise FlowError(agent="pipeline", attempts=1,
+                            last_error=f"unsatisfiable dependencies for steps {unmet}")
+        outcomes = await asyncio.gather(
+            *(executor(step, *(results[dep] for dep in step.deps)) for step in ready))
+        for step, outcome in zip(ready, outcomes):
+            results[step.name] = outcome
+        pending = [s for s in pending if s.name not in results]
+    return results
+
+
+# --- 8. THE ORCHESTRATOR (The "Brain") ---
+# Built once at import time; every orchestrator instance shares it instead
+# of re-allocating the (indented) literal per __init__.
+_SYSTEM_PROMPT = textwrap.dedent("""
+    You are a helpful medical assistant.
+    Use specialized tools for precise diagnosis.
+    Always validate findings with knowledge graphs.
+""").strip()
+
+class MedicalOrchestrator:
+    """
+    Central orchestrator that manages the multi-agent workflow.
+    In production, this would be powered by an LLM (GPT-4, Claude, etc.)
     """
-    print("\n" + "="*60)
-    print("   🤖 MEDICAL MULTI-AGENT SYSTEM - INTERACTIVE DEMO")
-    print("="*60)
-    print("\nThis demo simulates how the Vision Agent integrates")
-    print("into a larger healthcare AI pipeline.\n")
-    
-    orchestrator = MedicalOrchestrator()
     
-    while True:
-        print("\n" + "-"*40)
-        print("OPTIONS:")
-        print("  [1] Analyze sample MRI scan")
-        print("  [2] View system architecture")
-        print("  [3] Exit")
-        print("-"*40)
-        
-        choice = input("Select option: ").strip()
-        
-        if choice == "1":
-            user_query = "Can you analyze this brain MRI for any anomalies?"
-            test_image = "./data/test/patient_scan_001.jpg"
-            
-            report = orchestrator.process_request(user_query, test_image)
-            print(report)
-            
-        elif choice == "2":
-            print("""
+    def __init__(self, batch_size=4, max_wait_ms=50, router_threshold=0.9,
+                 history_limit=50, state_store=None, on_event=null_flow_sink):
+        self.system_prompt = _SYSTEM_PROMPT
+        # Observability: every agent transition is emitted as a FlowEvent.
+        # The demo attaches stdout_flow_sink; production wires metrics.
+        self.on_event = on_event
+        # Step journal: completed agent outcomes are checkpointed so an
+        # interrupted flow can resume without re-running inference.
+        self.state_store = state_store if state_store is not None else InMemoryStateStore()
+        # Short-term memory: bounded ring buffer so a long-running session
+        # caps memory at history_limit turns (oldest turns fall off;
+        # an LLM-backed build would summarize them instead).
+        self.history_limit = history_limit
+        self.conversation_history = deque(maxlen=history_limit)
+        # Cheap-first routing: a lightweight classifier answers trivial
+        # scans; only uncertain ones escalate to the full vision model.
+        self.router = TriageRouter()
+        self.router_threshold = router_threshold
+        # Microbatching: concurrent requests are buffered briefly and sent
+        # through a single vision-agent invocation.
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._vision_queue = asyncio.Queue()
+        self._vision_batch_worker = None
+        # Concurrency guard: bounds simultaneous vision inferences so a
+        # burst of batches cannot OOM the single GPU.
+        self._vision_sem = asyncio.Semaphore(int(os.getenv("VISION_CONCURRENCY", "2")))
+        # Reliability budgets: vision inference gets a longer leash than
+        # the lightweight validation fan-out.
+        self.vision_policy = NodePolicy(timeout_s=15.0, max_retries=3, backoff_s=0.5)
+        self.validation_policy = NodePolicy(timeout_s=5.0, max_retries=2, backoff_s=0.25)
+
+    async def _call_vision_batched(self, image_path):
+        """
+        Enqueues a scan for the next vision batch and awaits its result.
+        Each caller gets a Future resolved when its batch completes.
+        """
+        if self._vision_batch_worker is None or self._vision_batch_worker.done():
+            self._vision_batch_worker = asyncio.create_task(self._drain_vision_queue())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._vision_queue.put((image_path, future))
+        return await future
+
+    async def _drain_vision_queue(self):
+        """
+        Background worker: collects up to `batch_size` queued scans (waiting
+        at most `max_wait_ms` for stragglers) and runs one batched inference.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._vision_queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000.0
+
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._vision_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                async with self._vision_sem:
+                    responses = await run_vision_agent_batch(
+                        [path for path, _ in batch], on_event=self.on_event)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                for (_, future), response in zip(batch, responses):
+                    if not future.done():
+                        future.set_result(response)
+
+    async def _run_step(self, trace_id, step, make_call):
+        """
+        Runs one journaled workflow step. If an earlier run of this trace
+        already completed the step, its outcome is replayed from the state
+        store instead of re-invoking the agent.
+        """
+        completed = self.state_store.load(trace_id)
+        if step in completed:
+            self.on_event(FlowEvent(kind="resume", agent=step,
+                                    data={"step": step, "trace_id": trace_id}))
+            return completed[step]
+
+        outcome = await make_call()
+        self.state_store.save(trace_id, step, outcome)
+        return outcome
+
+    async def _execute_step(self, trace_id, step, *dep_outcomes):
+        """
+        Pipeline executor: wraps one AgentStepSpec invocation with the
+        step's retry policy (when one is configured) plus checkpoint
+        journaling, and revives typed outcomes replayed from a
+        JSON-backed store. New pipelines get all of this for free.
+        """
+        policy = {"vision": self.vision_policy,
+                  "validation": self.validation_policy}.get(step.name)
+        make_call = lambda: step.fn(*dep_outcomes)
+        if policy is not None:
+            run = lambda: invoke_with_policy(step.name, make_call, policy,
+                                             on_event=self.on_event)
+        else:
+            run = make_call
+
+        outcome = await self._run_step(trace_id, step.name, run)
+        if step.revive is not None and isinstance(outcome, dict):
+            outcome = step.revive(outcome)
+        return outcome
+
+    async def _validation_step(self, vision_data):
+        """
+        Pipeline step: cross-reference the vision diagnosis against the
+        validation sources.
+        """
+        self.on_event(FlowEvent(kind="route", data="VALIDATION_AGENT"))
+        return await call_validation_agent(vision_data.diagnosis, on_event=self.on_event)
+
+    async def process_request(self, user_query, image_path=None, trace_id=None):
+        """
+        Main entry point for processing user requests.
+        Implements routing logic to determine which agents to invoke.
+        Yields report chunks as the synthesizer produces them, so callers
+        see the first section immediately instead of waiting for the
+        whole report. Passing the trace_id of an interrupted run resumes
+        it from the last checkpointed step.
+        """
+        if trace_id is None:
+            trace_id = uuid.uuid4().hex
+        self.on_event(FlowEvent(kind="user_request", data=user_query))
+
+        self.conversation_history.append(
+            {"role": "user", "content": user_query, "timestamp": _now_iso()})
+
+        # LOGIC 1: ROUTING (Deciding what to do)
+        if image_path:
+            self.on_event(FlowEvent(kind="intent", data="Medical Image Analysis"))
+
+            # Cheap triage decides which agent backs the "vision" step —
+            # only uncertain scans escalate to the 2.5D Attention U-Net.
+            route, route_confidence = self.router.predict(image_path)
+            if route == TriageRouter.ROUTE_NO_TUMOR and route_confidence > self.router_threshold:
+                self.on_event(FlowEvent(kind="route", data="TRIAGE_ROUTER (fast path)"))
+                vision_fn = lambda: self._triage_response(route_confidence)
+            else:
+                self.on_event(FlowEvent(kind="route", data="VISION_AGENT_NODE"))
+                vision_fn = lambda: self._call_vision_batched(image_path)
+
+            # Declarative pipeline: validation needs the vision diagnosis,
+            # and the synthesizer warm-up rides alongside validation. The
+            # executor layers in retry policy + checkpointing per step.
+            pipeline = (
+                AgentStepSpec("vision", vision_fn, revive=_revive_vision_response),
+                AgentStepSpec("validation", self._validation_step, deps=("vision",)),
+                AgentStepSpec("prefetch", lambda _vision: self._prefetch_report_assets(),
+                              deps=("vision",)),
+            )
+            results = await execute_pipeline(
+                pipeline, functools.partial(self._execute_step, trace_id))
+            vision_data = results["vision"]
+            validation_data = results["validation"]
+
+            # Step 3: Synthesize final response, streaming section by section
+            async for chunk in self.synthesize_response(vision_data, validation_data):
+                yield chunk
+
+            self.conversation_history.append({
+                "role": "assistant",
+                "diagnosis": vision_data.diagnosis,
+                "severity": validation_data.get("severity", "Unknown"),
+                "timestamp": _now_iso(),
+            })
+        else:
+            yield "[Orchestrator] ⚠️ Please provide an MRI image for analysis."
+
+    @staticmethod
+    async def _triage_response(route_confidence):
+        """
+        Builds a vision-style payload for scans the triage router cleared,
+        so downstream validation/synthesis need no special casing. Async
+        so it slots into the pipeline like any other agent step.
+        """
+        return VisionResponse(
+            agent_id="triage_router_01",
+            agent_type="LightweightClassifier",
+            timestamp=_now_iso(),
+            diagnosis="No Tumor",
+            confidence_score=route_confidence,
+            stability_check="PASSED",
+            stability_score=route_confidence,
+            tumor_size_cm=0.0,
+            tumor_location="N/A",
+            explanation_path="N/A (not escalated to vision agent)",
+            model_version="router-v1.0",
+        )
+
+    async def _prefetch_report_assets(self):
+        """
+        Simulates warming up the report synthesizer (template loading,
+        LLM context priming) concurrently with the validation round-trip.
+        """
+        await _simulate_latency(1)
+
+    async def synthesize_response(self, vision_data, validation_data):
+        """
+        Combines outputs from multiple agents into a coherent report,
+        yielded section by section. This simulates how an LLM would
+        stream natural language generated from structured data.
+        """
+        self.on_event(FlowEvent(kind="synthesize"))
+
+        # Remaining derived fields (diagnosis_upper and confidence_pct
+        # already live on VisionResponse) are computed once per report
+        derived = {
+            "timestamp_short": vision_data.timestamp[:19],
+            "stability_status": "✅ Stable" if vision_data.stability_check == "PASSED" else "⚠️ Unstable",
+            "treatments_str": ', '.join(validation_data.get('common_treatments', ['N/A'])),
+        }
+        report_fields = ChainMap(derived, asdict(vision_data), validation_data, _REPORT_DEFAULTS)
+        for section in _REPORT_SECTIONS:
+            yield section.format_map(report_fields)
+
+
+async def stream_report(orchestrator, user_query, image_path=None):
+    """
+    Drives one request end-to-end, writing report chunks to stdout as
+    the orchestrator streams them. Chunks go through buffered
+    sys.stdout.write with one explicit flush at the end, so a report
+    costs one flush syscall instead of one per printed line — on a TTY
+    line buffering still shows sections as they arrive.
+    """
+    write = sys.stdout.write
+    async for chunk in orchestrator.process_request(user_query, image_path):
+        write(chunk)
+    write("\n")
+    sys.stdout.flush()
+
+
+# --- 9. INTERACTIVE CLI DEMO ---
+# Optional dependency: the interactive demo prefers prompt_toolkit's
+# asyncio-native prompt so background work (queued batches, prefetches)
+# keeps running while the user types; without it we degrade to input()
+# on a worker thread.
+def _make_prompt_session():
+    try:
+        # Deferred: only the interactive path pays the import
+        from prompt_toolkit import PromptSession
+    except ImportError:
+        return None
+    return PromptSession()
+
+
+async def _prompt(session, message):
+    """
+    Reads one line of user input without blocking the event loop.
+    """
+    if session is not None:
+        answer = await session.prompt_async(message)
+    else:
+        answer = await asyncio.to_thread(input, message)
+    return answer.strip()
+
+
+# Shared constant for option [2]; built once instead of per keypress.
+_ARCHITECTURE_DIAGRAM = """
     ┌─────────────────────────────────────────────────────────┐
     │              MULTI-AGENT SYSTEM ARCHITECTURE            │
     └─────────────────────────────────────────────────────────┘
-    
+
          ┌──────────────┐
          │  User Input  │
          │  (MRI Scan)  │
@@ -233,8 +863,44 @@ def run_interactive_demo():
          │   CLINICAL   │
          │    REPORT    │
          └──────────────┘
-            """)
-            
+            """
+
+
+async def run_interactive_demo(orchestrator=None):
+    """
+    Interactive demonstration mode for presenting to stakeholders.
+    Runs inside the event loop, so queued orchestrations keep making
+    progress while the prompt waits for input.
+    """
+    print("\n" + "="*60)
+    print("   🤖 MEDICAL MULTI-AGENT SYSTEM - INTERACTIVE DEMO")
+    print("="*60)
+    print("\nThis demo simulates how the Vision Agent integrates")
+    print("into a larger healthcare AI pipeline.\n")
+
+    if orchestrator is None:
+        orchestrator = MedicalOrchestrator(on_event=stdout_flow_sink)
+    session = _make_prompt_session()
+
+    while True:
+        print("\n" + "-"*40)
+        print("OPTIONS:")
+        print("  [1] Analyze sample MRI scan")
+        print("  [2] View system architecture")
+        print("  [3] Exit")
+        print("-"*40)
+
+        choice = await _prompt(session, "Select option: ")
+
+        if choice == "1":
+            user_query = "Can you analyze this brain MRI for any anomalies?"
+            test_image = "./data/test/patient_scan_001.jpg"
+
+            await stream_report(orchestrator, user_query, test_image)
+
+        elif choice == "2":
+            print(_ARCHITECTURE_DIAGRAM)
+
         elif choice == "3":
             print("\n👋 Exiting Multi-Agent System Demo. Goodbye!")
             break
@@ -242,7 +908,27 @@ def run_interactive_demo():
             print("❌ Invalid option. Please select 1, 2, or 3.")
 
 
-# --- 5. RUN THE SIMULATION ---
+# --- 10. RUN THE SIMULATION ---
+async def main():
+    # Run simple demo first
+    print("--- RUNNING AUTOMATED DEMO ---\n")
+
+    bot = MedicalOrchestrator(on_event=stdout_flow_sink)
+
+    # Scenario: A doctor uploads a scan
+    user_query = "Can you check this MRI for any anomalies?"
+    test_image = "./data/test/scan_04.jpg"
+
+    await stream_report(bot, user_query, test_image)
+
+    # Ask if user wants interactive mode
+    print("\n" + "="*60)
+    response = await _prompt(_make_prompt_session(),
+                             "Would you like to enter interactive mode? (y/n): ")
+    if response.lower() == 'y':
+        await run_interactive_demo(bot)
+
+
 if __name__ == "__main__":
     print("""
     ╔═══════════════════════════════════════════════════════════╗
@@ -256,21 +942,5 @@ if __name__ == "__main__":
     ║                                                           ║
     ╚═══════════════════════════════════════════════════════════╝
     """)
-    
-    # Run simple demo first
-    print("--- RUNNING AUTOMATED DEMO ---\n")
-    
-    bot = MedicalOrchestrator()
-    
-    # Scenario: A doctor uploads a scan
-    user_query = "Can you check this MRI for any anomalies?"
-    test_image = "./data/test/scan_04.jpg"
-    
-    final_output = bot.process_request(user_query, test_image)
-    print(final_output)
-    
-    # Ask if user wants interactive mode
-    print("\n" + "="*60)
-    response = input("Would you like to enter interactive mode? (y/n): ").strip().lower()
-    if response == 'y':
-        run_interactive_demo()
+
+    asyncio.run(main())